@@ -7,22 +7,67 @@ This script analyzes vocabulary from transcriptions and builds a database
 of suggested improvements based on various linguistic features.
 """
 
+import argparse
 import pandas as pd
 import spacy
 import json
 import os
-import sys
 from pathlib import Path
 from collections import Counter
 
-# Load French language model
 try:
-    nlp = spacy.load("fr_core_news_md")
-except OSError:
-    print("Downloading French language model...")
-    from spacy.cli import download
-    download("fr_core_news_md")
-    nlp = spacy.load("fr_core_news_md")
+    import fcntl
+except ImportError:  # Windows: enrichment from concurrent processes is not locked
+    fcntl = None
+
+from corpus_stats import CorpusStats
+from phrase_ngrams import count_phrase_ngrams
+from vocab_store import CompactVocabulary
+
+# French language model and pipeline profiles
+SPACY_MODEL = "fr_core_news_md"
+
+# analyze_text only needs tokens, stop words, lemmas, POS and sentence
+# boundaries. The "fast" profile drops the dependency parser and NER and
+# splits sentences on punctuation with the rule-based sentencizer. Sentence
+# counts can therefore differ from "accurate" on unpunctuated transcripts;
+# lemmas and POS tags are identical since the morphologizer is kept.
+PIPELINE_PROFILES = {
+    "fast": {
+        "exclude": ["parser", "ner"],
+        "sentencizer": True
+    },
+    "accurate": {
+        "exclude": [],
+        "sentencizer": False
+    }
+}
+DEFAULT_PROFILE = "accurate"
+
+_pipelines = {}
+_compact_vocabulary = None
+
+def get_nlp(profile=DEFAULT_PROFILE):
+    """Load (once) the spaCy pipeline for a named profile"""
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown pipeline profile: {profile} (expected one of {', '.join(PIPELINE_PROFILES)})")
+    
+    if profile not in _pipelines:
+        config = PIPELINE_PROFILES[profile]
+        try:
+            nlp = spacy.load(SPACY_MODEL, exclude=config["exclude"])
+        except OSError:
+            print("Downloading French language model...")
+            from spacy.cli import download
+            download(SPACY_MODEL)
+            nlp = spacy.load(SPACY_MODEL, exclude=config["exclude"])
+        
+        if config["sentencizer"]:
+            nlp.add_pipe("sentencizer")
+        
+        _pipelines[profile] = nlp
+    
+    return _pipelines[profile]
 
 # Constants
 REGISTERS = {
@@ -41,6 +86,8 @@ CATEGORIES = [
 ]
 
 VOCABULARY_DIR = Path("vocabulaire")
+ENRICHED_FILE = "vocabulaire_enrichi.csv"
+TOP_K_SUGGESTIONS = 10
 OUTPUT_DIR = Path("output")
 
 def ensure_dirs():
@@ -71,56 +118,99 @@ def load_vocabulary():
             "niveau": []
         })
 
-def analyze_text(text):
-    """Analyze text and identify improvement opportunities"""
-    doc = nlp(text)
+def read_enriched_pairs(f):
+    """(motOriginal, motAmeliore) pairs already in an open enriched vocabulary file"""
+    f.seek(0)
+    if not f.read(1):
+        return set()
+    f.seek(0)
+    df = pd.read_csv(f, usecols=["motOriginal", "motAmeliore"], dtype=str, keep_default_na=False)
+    return set(zip(df["motOriginal"], df["motAmeliore"]))
+
+def load_compact_vocabulary():
+    """Load (once) the compact vocabulary used for lookups
+
+    When ELOQUENCE_VOCAB_SHM names a block shared with vocab_store.py serve,
+    it is mapped instead of loading the CSV files in this process. Otherwise
+    the CSV files are encoded straight into the arrays with pyarrow.
+    """
+    global _compact_vocabulary
+    
+    if _compact_vocabulary is None:
+        shm_name = os.getenv("ELOQUENCE_VOCAB_SHM")
+        if shm_name:
+            _compact_vocabulary = CompactVocabulary.attach(shm_name)
+        else:
+            _compact_vocabulary = CompactVocabulary.from_csv(VOCABULARY_DIR.glob("*.csv"))
+    
+    return _compact_vocabulary
+
+def analyze_text(text, profile=DEFAULT_PROFILE, corpus=None, user_id=None, top_k=TOP_K_SUGGESTIONS):
+    """Analyze text and identify improvement opportunities
+
+    Suggestions are ranked by how overused each word or phrase is in this
+    text relative to the corpus (see corpus_stats.py) and capped to top_k.
+    When a corpus is given, the text is added to it after scoring.
+    """
+    doc = get_nlp(profile)(text)
+    if corpus is None:
+        corpus = CorpusStats(":memory:")
     
     # Load the vocabulary database
-    vocab_df = load_vocabulary()
+    vocab = load_compact_vocabulary()
     
-    # Simple word frequency
-    words = [token.text.lower() for token in doc if token.is_alpha and not token.is_stop]
-    word_freq = Counter(words)
+    # Simple word frequency, with the lemma of each word for corpus statistics
+    content_tokens = [token for token in doc if token.is_alpha and not token.is_stop]
+    word_freq = Counter(token.text.lower() for token in content_tokens)
+    word_lemmas = {token.text.lower(): token.lemma_.lower() for token in content_tokens}
+    doc_length = len([t for t in doc if t.is_alpha])
     
     # Find common words that could be improved
-    improvements = []
+    candidates = []
     
     # Simple direct replacements from our vocabulary database
     for word, count in word_freq.items():
         if count > 1:  # Look for repeated words as candidates for improvement
             # Find potential replacements in our vocabulary database
-            replacements = vocab_df[vocab_df["motOriginal"].str.lower() == word.lower()]
+            replacement = vocab.lookup(word)
             
-            if not replacements.empty:
-                replacement = replacements.iloc[0]
-                improvements.append({
+            if replacement is not None:
+                lemma = word_lemmas[word]
+                candidates.append({
                     "original": word,
                     "suggestion": replacement["motAmeliore"],
-                    "raison": replacement["raison"]
+                    "raison": replacement["raison"],
+                    "score": corpus.overuse_score(lemma, count, doc_length, user_id)
                 })
     
-    # Find overused phrases (bigrams/trigrams)
-    # This is a simple implementation - more sophisticated NLP could be used
-    from nltk.util import ngrams
+    # Find overused phrases (2- to 5-grams), even when no vocabulary entry exists
+    overused_phrases = []
+    phrase_ngrams = count_phrase_ngrams(doc)
     
-    if len(doc) > 3:
-        tokens = [token.text.lower() for token in doc]
-        bigrams = list(ngrams(tokens, 2))
-        bigram_freq = Counter(bigrams)
-        
-        for bg, count in bigram_freq.most_common(3):
-            if count > 1:
-                phrase = " ".join(bg)
-                # Check our vocabulary for phrase improvements
-                phrase_matches = vocab_df[vocab_df["motOriginal"].str.lower() == phrase.lower()]
-                
-                if not phrase_matches.empty:
-                    replacement = phrase_matches.iloc[0]
-                    improvements.append({
-                        "original": phrase,
-                        "suggestion": replacement["motAmeliore"],
-                        "raison": replacement["raison"]
-                    })
+    for n, top_phrases in phrase_ngrams.items():
+        for phrase, count in top_phrases:
+            overused_phrases.append({
+                "phrase": phrase,
+                "count": count,
+                "n": n
+            })
+            
+            # Check our vocabulary for phrase improvements
+            replacement = vocab.lookup(phrase)
+            
+            if replacement is not None:
+                candidates.append({
+                    "original": phrase,
+                    "suggestion": replacement["motAmeliore"],
+                    "raison": replacement["raison"],
+                    "score": corpus.overuse_score(phrase, count, doc_length, user_id)
+                })
+    
+    # Keep the most overused candidates first
+    improvements = sorted(candidates, key=lambda c: c["score"], reverse=True)[:top_k]
+    
+    # Phrases are tracked in the corpus like lemmas
+    corpus.add_document(list(word_lemmas.values()) + [p["phrase"] for p in overused_phrases], user_id)
     
     # Generate simple statistics
     stats = {
@@ -132,22 +222,45 @@ def analyze_text(text):
     
     return {
         "improvements": improvements,
+        "overused_phrases": overused_phrases,
         "statistics": stats
     }
 
-def enrich_vocabulary_database(text, improvements):
-    """Add new vocabulary improvements to the database"""
-    vocab_df = load_vocabulary()
+def corpus_terms(doc):
+    """Terms of a document as counted by analyze_text in the corpus statistics"""
+    lemmas = [token.lemma_.lower() for token in doc if token.is_alpha and not token.is_stop]
+    phrases = [phrase for top_phrases in count_phrase_ngrams(doc).values() for phrase, _ in top_phrases]
+    return lemmas + phrases
+
+def enrich_vocabulary_database(text, improvements, profile=DEFAULT_PROFILE):
+    """Add new vocabulary improvements to the database
+
+    New entries are appended to ENRICHED_FILE; existing files are never
+    rewritten. Existing pairs are looked up in the compact vocabulary, and in
+    ENRICHED_FILE itself, which is re-read on each call: the compact
+    vocabulary (shared or not) is a snapshot that misses rows appended since,
+    possibly by other processes.
+    """
+    vocab = load_compact_vocabulary()
+    enriched_file = VOCABULARY_DIR / ENRICHED_FILE
     
-    new_entries = []
-    for improvement in improvements:
-        # Check if we already have this improvement
-        exists = ((vocab_df["motOriginal"] == improvement["original"]) & 
-                 (vocab_df["motAmeliore"] == improvement["suggestion"])).any()
+    with open(enriched_file, "a+", encoding="utf-8", newline="") as f:
+        # Check and append under one lock, so concurrent writers do not both add a pair
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        known_pairs = read_enriched_pairs(f)
         
-        if not exists:
+        new_entries = []
+        for improvement in improvements:
+            # Check if we already have this improvement
+            pair = (improvement["original"], improvement["suggestion"])
+            
+            if pair in known_pairs or vocab.contains(*pair):
+                continue
+            known_pairs.add(pair)
+            
             # Determine category based on POS tagging
-            doc = nlp(improvement["original"])
+            doc = get_nlp(profile)(improvement["original"])
             
             if len(doc) == 0:
                 continue
@@ -175,36 +288,40 @@ def enrich_vocabulary_database(text, improvements):
                 "niveau": "courant"  # Default level
             }
             new_entries.append(new_entry)
-    
-    if new_entries:
-        new_df = pd.DataFrame(new_entries)
-        updated_df = pd.concat([vocab_df, new_df], ignore_index=True)
         
-        # Save to a new enriched vocabulary file
-        timestamp = pd.Timestamp.now().strftime("%Y%m%d")
-        updated_df.to_csv(VOCABULARY_DIR / f"vocabulaire_enrichi_{timestamp}.csv", index=False)
+        if new_entries:
+            # Append only the new rows to the enriched vocabulary file
+            f.seek(0, os.SEEK_END)
+            pd.DataFrame(new_entries).to_csv(f, header=f.tell() == 0, index=False)
         
     return len(new_entries)
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyze vocabulary in a transcription")
+    parser.add_argument("text", help="Text file or direct text input")
+    parser.add_argument("--profile", choices=list(PIPELINE_PROFILES), default=DEFAULT_PROFILE,
+                        help="spaCy pipeline profile (default: %(default)s)")
+    parser.add_argument("--user", help="Speaker id, to rank suggestions against their own habits")
+    parser.add_argument("--top-k", type=int, default=TOP_K_SUGGESTIONS,
+                        help="Maximum number of suggestions (default: %(default)s)")
+    args = parser.parse_args()
+    
     ensure_dirs()
     
-    if len(sys.argv) > 1:
-        input_file = sys.argv[1]
-        
-        if os.path.exists(input_file):
-            with open(input_file, 'r', encoding='utf-8') as f:
-                text = f.read()
-        else:
-            text = sys.argv[1]  # Assume direct text input
+    if os.path.exists(args.text):
+        with open(args.text, 'r', encoding='utf-8') as f:
+            text = f.read()
     else:
-        print("Usage: python analyze_vocab.py <text_file_or_direct_text>")
-        return
+        text = args.text  # Assume direct text input
     
-    result = analyze_text(text)
+    corpus = CorpusStats()
+    try:
+        result = analyze_text(text, profile=args.profile, corpus=corpus, user_id=args.user, top_k=args.top_k)
+    finally:
+        corpus.close()
     
     # Enrich our vocabulary database with new improvements
-    new_entries = enrich_vocabulary_database(text, result["improvements"])
+    new_entries = enrich_vocabulary_database(text, result["improvements"], profile=args.profile)
     print(f"Added {new_entries} new vocabulary entries to the database.")
     
     # Output results
@@ -215,6 +332,11 @@ def main():
     print(f"Analysis complete. Results saved to {output_file}")
     print(f"Found {len(result['improvements'])} potential vocabulary improvements.")
     
+    if result["overused_phrases"]:
+        print("\nOverused phrases:")
+        for item in result["overused_phrases"]:
+            print(f"- \"{item['phrase']}\" ({item['count']}x)")
+    
     # Print statistics
     stats = result["statistics"]
     print("\nText Statistics:")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Pipeline Profile Benchmark for Eloquence App
+
+This script measures the throughput (tokens per second) of each spaCy
+pipeline profile used by analyze_vocab.py on a set of transcripts, and
+reports how their sentence counts differ.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from analyze_vocab import PIPELINE_PROFILES, get_nlp
+
+def load_transcripts(paths):
+    """Load transcripts from text files or directories of .txt files"""
+    texts = []
+
+    for path in map(Path, paths):
+        files = sorted(path.glob("*.txt")) if path.is_dir() else [path]
+        for file in files:
+            texts.append(file.read_text(encoding="utf-8"))
+
+    return texts
+
+def benchmark_profile(profile, texts, repeat=3):
+    """Return the best tokens/second over several runs, and the sentence count"""
+    nlp = get_nlp(profile)
+
+    # Warm up so model loading is not measured
+    list(nlp.pipe(texts[:1]))
+
+    best_rate = 0
+    token_count = 0
+    sentence_count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        docs = list(nlp.pipe(texts))
+        elapsed = time.perf_counter() - start
+
+        token_count = sum(len(doc) for doc in docs)
+        sentence_count = sum(len(list(doc.sents)) for doc in docs)
+        if elapsed > 0:
+            best_rate = max(best_rate, token_count / elapsed)
+
+    return {
+        "profile": profile,
+        "tokens": token_count,
+        "sentences": sentence_count,
+        "tokens_per_second": best_rate
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spaCy pipeline profiles on transcripts")
+    parser.add_argument("paths", nargs="+", help="Transcript files or directories of .txt files")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per profile")
+    args = parser.parse_args()
+
+    texts = load_transcripts(args.paths)
+    if not texts:
+        print("No transcripts found.")
+        return
+
+    results = [benchmark_profile(profile, texts, args.repeat) for profile in PIPELINE_PROFILES]
+    # Speedups are relative to the full pipeline
+    baseline = next((r["tokens_per_second"] for r in results if r["profile"] == "accurate"), 0) or 1
+
+    print(f"Benchmark over {len(texts)} transcripts:")
+    for result in results:
+        speedup = result["tokens_per_second"] / baseline
+        print(f"- {result['profile']}: {result['tokens_per_second']:.0f} tokens/s "
+              f"(x{speedup:.2f}), {result['sentences']} sentences")
+
+if __name__ == "__main__":
+    main()
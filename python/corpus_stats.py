@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Corpus Statistics Store for Eloquence App
+
+This module keeps document frequencies per lemma across all analyzed
+transcripts, plus per-user baselines, so vocabulary suggestions can be
+ranked by how overused a word is compared to the rest of the corpus.
+
+Counts live in a SQLite file and are updated in place with UPSERTs, so
+adding a document costs O(distinct terms in the document), lookups are
+primary-key reads, and concurrent writers (the CLI and the consumer) never
+overwrite each other's increments. The corpus-wide counts are stored under
+the empty user id.
+"""
+
+import math
+import sqlite3
+from pathlib import Path
+
+# Configuration
+CORPUS_DB = Path("output/corpus_stats.sqlite")
+CORPUS_USER = ""  # user id under which corpus-wide counts are stored
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    user_id TEXT
+);
+CREATE TABLE IF NOT EXISTS doc_counts (
+    user_id TEXT PRIMARY KEY,
+    doc_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lemma_df (
+    user_id TEXT NOT NULL,
+    lemma TEXT NOT NULL,
+    df INTEGER NOT NULL,
+    PRIMARY KEY (user_id, lemma)
+) WITHOUT ROWID;
+"""
+
+class CorpusStats:
+    """Document frequencies per lemma, for the whole corpus and per user
+
+    Pass path=":memory:" for a throwaway store.
+    """
+
+    def __init__(self, path=CORPUS_DB):
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(exist_ok=True)
+        self.conn = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add_document(self, lemmas, user_id=None, doc_id=None):
+        """Count each distinct lemma of a document once
+
+        With a doc_id, a document already counted is skipped, so retries are
+        safe. Returns whether the document was added.
+        """
+        unique = set(lemmas)
+        owners = [CORPUS_USER] if user_id is None else [CORPUS_USER, str(user_id)]
+
+        # One write transaction per document; other writers wait on the lock
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if doc_id is not None:
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO documents (id, user_id) VALUES (?, ?)",
+                    (str(doc_id), None if user_id is None else str(user_id))
+                )
+                if cur.rowcount == 0:
+                    self.conn.execute("ROLLBACK")
+                    return False
+
+            self.conn.executemany("""
+                INSERT INTO doc_counts (user_id, doc_count) VALUES (?, 1)
+                ON CONFLICT (user_id) DO UPDATE SET doc_count = doc_count + 1
+            """, [(owner,) for owner in owners])
+            self.conn.executemany("""
+                INSERT INTO lemma_df (user_id, lemma, df) VALUES (?, ?, 1)
+                ON CONFLICT (user_id, lemma) DO UPDATE SET df = df + 1
+            """, [(owner, lemma) for owner in owners for lemma in unique])
+            self.conn.execute("COMMIT")
+            return True
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def doc_count(self, user_id=CORPUS_USER):
+        """Number of documents of a user (of the corpus by default)"""
+        row = self.conn.execute(
+            "SELECT doc_count FROM doc_counts WHERE user_id = ?", (str(user_id),)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def df(self, lemma, user_id=CORPUS_USER):
+        """Number of documents of a user (of the corpus by default) containing the lemma"""
+        row = self.conn.execute(
+            "SELECT df FROM lemma_df WHERE user_id = ? AND lemma = ?", (str(user_id), lemma)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def idf(self, lemma):
+        """Smoothed inverse document frequency (1.0 for an empty corpus)"""
+        return math.log((1 + self.doc_count()) / (1 + self.df(lemma))) + 1
+
+    def user_rate(self, user_id, lemma):
+        """Share of a user's documents that contain the lemma"""
+        if user_id is None:
+            return 0.0
+        doc_count = self.doc_count(user_id)
+        if not doc_count:
+            return 0.0
+        return self.df(lemma, user_id) / doc_count
+
+    def user_lift(self, user_id, lemma):
+        """How much more often than the corpus a user's documents contain the lemma"""
+        doc_count = self.doc_count()
+        corpus_rate = self.df(lemma) / doc_count if doc_count else 0.0
+        if not corpus_rate:
+            return 1.0
+        return self.user_rate(user_id, lemma) / corpus_rate
+
+    def overuse_score(self, lemma, count, doc_length, user_id=None):
+        """TF-IDF of a lemma in a document, boosted when the user uses it more than the corpus"""
+        if doc_length == 0:
+            return 0.0
+        tf = count / doc_length
+        return tf * self.idf(lemma) * max(1.0, self.user_lift(user_id, lemma))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Phrase N-gram Counting for Eloquence App
+
+This module finds the phrases a speaker repeats most often ("en fait",
+"du coup", "c'est vrai que"...), whether or not they already exist in the
+vocabulary database.
+
+N-grams are counted on spaCy token IDs with a polynomial rolling hash, so no
+tuple of strings is built per window. Windows never cross punctuation or
+whitespace tokens, and grams made only of function words ("de la", "et le")
+are ignored. Only maximal phrases are reported: a gram is dropped when a
+longer reported gram containing it has the same count, so "c'est vrai que"
+is not also reported as "c'est vrai" and "est vrai que".
+"""
+
+import heapq
+
+# Constants
+MIN_N = 2
+MAX_N = 5
+TOP_K = 5
+MIN_COUNT = 2
+
+# Mersenne prime modulus and base for the rolling hash
+HASH_MOD = (1 << 61) - 1
+HASH_BASE = 1_000_003
+
+# Parts of speech that cannot carry a phrase on their own
+FUNCTION_POS = {"ADP", "AUX", "CCONJ", "DET", "PART", "PRON", "SCONJ"}
+
+def split_segments(doc):
+    """Split a document into runs of tokens not broken by punctuation"""
+    segments = []
+    start = None
+
+    for token in doc:
+        if token.is_punct or token.is_space:
+            if start is not None:
+                segments.append((start, token.i))
+                start = None
+        elif start is None:
+            start = token.i
+
+    if start is not None:
+        segments.append((start, len(doc)))
+
+    return segments
+
+def gram_hash(ids):
+    """Rolling hash of a whole window, as computed by count_segment"""
+    h = 0
+    for token_id in ids:
+        h = (h * HASH_BASE + token_id) % HASH_MOD
+    return h
+
+def count_segment(ids, content, offset, n, counts, first_seen):
+    """Count the n-grams of one segment with a rolling hash"""
+    if len(ids) < n:
+        return
+
+    high = pow(HASH_BASE, n - 1, HASH_MOD)
+    h = 0
+    content_count = 0
+    for i in range(n):
+        h = (h * HASH_BASE + ids[i]) % HASH_MOD
+        content_count += content[i]
+
+    for i in range(len(ids) - n + 1):
+        if i > 0:
+            # Slide the window: drop ids[i - 1], add ids[i + n - 1]
+            h = ((h - ids[i - 1] * high) * HASH_BASE + ids[i + n - 1]) % HASH_MOD
+            content_count += content[i + n - 1] - content[i - 1]
+
+        if content_count == 0:
+            continue
+
+        counts[h] = counts.get(h, 0) + 1
+        if h not in first_seen:
+            first_seen[h] = offset + i
+
+def count_phrase_ngrams(doc, min_n=MIN_N, max_n=MAX_N, top_k=TOP_K, min_count=MIN_COUNT):
+    """Return the top-k repeated maximal phrases of each length in a spaCy document
+
+    The result maps each n to a list of (phrase, count) pairs, most frequent
+    first. Ties are broken by first occurrence in the text.
+    """
+    segments = split_segments(doc)
+
+    # Precompute token IDs and content flags once for all values of n
+    ids = [token.lower % HASH_MOD for token in doc]
+    content = [0 if token.pos_ in FUNCTION_POS else 1 for token in doc]
+
+    # (hash, count) of the sub-grams of longer reported grams
+    subsumed = set()
+
+    result = {}
+    # Longest grams first, so their sub-grams are known before ranking shorter ones
+    for n in range(max_n, min_n - 1, -1):
+        counts = {}
+        first_seen = {}
+
+        for start, end in segments:
+            count_segment(ids[start:end], content[start:end], start, n, counts, first_seen)
+
+        # Bounded heap of size top_k over the repeated, maximal grams
+        top = heapq.nlargest(
+            top_k,
+            ((count, -first_seen[h], h) for h, count in counts.items()
+             if count >= min_count and (h, count) not in subsumed)
+        )
+
+        result[n] = []
+        for count, _, h in top:
+            start = first_seen[h]
+            result[n].append((doc[start:start + n].text.lower(), count))
+
+            for k in range(min_n, n):
+                for i in range(start, start + n - k + 1):
+                    subsumed.add((gram_hash(ids[i:i + k]), count))
+
+    return {n: result[n] for n in range(min_n, max_n + 1)}
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Incremental Analysis Consumer for Eloquence App
+
+This long-running script LISTENs for inserts on analyses_eloquence and
+processes the new rows in micro-batches:
+
+- per-user aggregates (sessions, duration, score sums) are upserted in
+  output/user_aggregates.sqlite, one transaction per batch; the analyses
+  already counted are recorded there too, so each is counted once;
+- substitutions of the new analyses enrich the vocabulary database;
+- transcripts are added to the corpus statistics used to rank suggestions.
+
+Notifications are pushed into a bounded queue. When the worker falls behind
+the listener blocks on the full queue and stops draining notifications,
+which Postgres keeps buffered for the connection (backpressure).
+
+Usage:
+    python recording_listener.py install-trigger [--dsn DSN]
+    python recording_listener.py run [--dsn DSN] [--batch-size N] ...
+
+--dsn defaults to SUPABASE_DB_URL, so a local Postgres can be used for tests.
+"""
+
+import os
+import time
+import queue
+import select
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+
+from corpus_stats import CorpusStats
+from sql_integration import OUTPUT_DIR, ensure_dirs, get_db_connection
+from storage import SQLITE_TIMESTAMP_FORMAT
+
+# Configuration
+NOTIFY_CHANNEL = "analyses_eloquence_insert"
+AGGREGATES_DB = OUTPUT_DIR / "user_aggregates.sqlite"
+
+QUEUE_SIZE = 1000
+BATCH_SIZE = 100
+BATCH_WINDOW = 2.0  # seconds to wait for a batch to fill up
+POLL_TIMEOUT = 5.0
+RETRY_DELAY = 10.0  # seconds before retrying a failed batch
+MAX_ATTEMPTS = 3  # tries of a batch before it is split, or its id dead-lettered
+RECENT_IDS = 10000  # ids remembered to skip duplicates from catch-up
+# created_at is set at insert time but rows commit later, so catch-up rescans
+# this far before the watermark; rows already processed there are skipped
+CATCH_UP_MARGIN = pd.Timedelta(minutes=10)
+
+METRICS = [
+    "score_eloquence",
+    "score_fluidite",
+    "score_vocabulaire",
+    "score_grammaire",
+    "score_rythme"
+]
+
+TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION notify_analyses_eloquence_insert() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', NEW.id::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS analyses_eloquence_notify ON analyses_eloquence;
+CREATE TRIGGER analyses_eloquence_notify
+    AFTER INSERT ON analyses_eloquence
+    FOR EACH ROW EXECUTE FUNCTION notify_analyses_eloquence_insert();
+"""
+
+BATCH_QUERY = """
+    SELECT
+        ae.id,
+        ae.created_at AS analysed_at,
+        e.user_id,
+        e.created_at,
+        e.duree,
+        e.score_eloquence,
+        ae.score_fluidite,
+        ae.score_vocabulaire,
+        ae.score_grammaire,
+        ae.score_rythme,
+        ae.substitutions,
+        e.transcript
+    FROM
+        analyses_eloquence ae
+    JOIN
+        enregistrements e ON ae.enregistrement_id = e.id
+    WHERE
+        ae.id = ANY(%s::uuid[])
+    ORDER BY
+        ae.created_at
+"""
+
+AGGREGATES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    sessions INTEGER NOT NULL,
+    total_duration REAL NOT NULL,
+    last_session_at TEXT
+);
+CREATE TABLE IF NOT EXISTS scores (
+    user_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, metric)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS processed (
+    id TEXT PRIMARY KEY,
+    analysed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS processed_analysed_at ON processed (analysed_at);
+CREATE TABLE IF NOT EXISTS failed (
+    id TEXT PRIMARY KEY,
+    error TEXT,
+    failed_at TEXT NOT NULL
+);
+"""
+
+CATCH_UP_QUERY = """
+    SELECT id::text AS id
+    FROM analyses_eloquence
+    WHERE created_at >= %s
+    ORDER BY created_at
+"""
+
+def utc_timestamp(value):
+    """Timestamp as fixed-format UTC text, so values compare correctly as strings"""
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return ts.strftime(SQLITE_TIMESTAMP_FORMAT)
+
+class UserAggregates:
+    """Running per-user aggregates, upserted one analysis at a time
+
+    Each analysis id is recorded in the processed table in the same
+    transaction as its increments, so an analysis is never counted twice.
+    """
+
+    def __init__(self, path=AGGREGATES_DB):
+        self.conn = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        self.conn.executescript(AGGREGATES_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    @property
+    def watermark(self):
+        """Latest analysed_at already counted, or None"""
+        return self.conn.execute("SELECT MAX(analysed_at) FROM processed").fetchone()[0]
+
+    def processed_since(self, since):
+        """Ids of the analyses already counted with analysed_at >= since"""
+        rows = self.conn.execute(
+            "SELECT id FROM processed WHERE analysed_at >= ?", (utc_timestamp(since),)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def update(self, records):
+        """Add a batch of analyses to the aggregates and return how many were new"""
+        added = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for row in records:
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO processed (id, analysed_at) VALUES (?, ?)",
+                    (str(row["id"]), utc_timestamp(row["analysed_at"]))
+                )
+                if cur.rowcount == 0:
+                    continue
+                added += 1
+
+                user_id = str(row["user_id"])
+                self.conn.execute("""
+                    INSERT INTO users (user_id, sessions, total_duration, last_session_at)
+                    VALUES (?, 1, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        sessions = sessions + 1,
+                        total_duration = total_duration + excluded.total_duration,
+                        last_session_at = MAX(last_session_at, excluded.last_session_at)
+                """, (user_id, float(row["duree"] or 0), utc_timestamp(row["created_at"])))
+
+                self.conn.executemany("""
+                    INSERT INTO scores (user_id, metric, sum, count) VALUES (?, ?, ?, 1)
+                    ON CONFLICT (user_id, metric) DO UPDATE SET
+                        sum = sum + excluded.sum,
+                        count = count + 1
+                """, [(user_id, metric, float(row[metric]))
+                      for metric in METRICS if row.get(metric) is not None])
+            self.conn.execute("COMMIT")
+            return added
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def dead_letter(self, ids, error):
+        """Record analyses that kept failing, so they can be inspected and replayed"""
+        failed_at = utc_timestamp(pd.Timestamp.now(tz="UTC"))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO failed (id, error, failed_at) VALUES (?, ?, ?)",
+            [(str(analysis_id), str(error), failed_at) for analysis_id in ids]
+        )
+
+    def averages(self, user_id):
+        """Average of each metric for a user"""
+        rows = self.conn.execute(
+            "SELECT metric, sum, count FROM scores WHERE user_id = ?", (str(user_id),)
+        ).fetchall()
+        averages = {metric: None for metric in METRICS}
+        averages.update({metric: total / count for metric, total, count in rows if count})
+        return averages
+
+def install_trigger(dsn=None):
+    """Create the trigger that notifies NOTIFY_CHANNEL on each insert"""
+    conn = get_db_connection(dsn)
+    if not conn:
+        return False
+
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(TRIGGER_SQL)
+        return True
+    finally:
+        conn.close()
+
+def listen(dsn, work_queue, stop_event, ready_event):
+    """Forward notifications to the work queue until stop_event is set
+
+    ready_event is set once LISTEN is active on the connection.
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(dsn or os.getenv("SUPABASE_DB_URL"))
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+        ready_event.set()
+
+        while not stop_event.is_set():
+            if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                continue
+
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                # Block while the queue is full, but keep honouring stop_event
+                while not stop_event.is_set():
+                    try:
+                        work_queue.put(notify.payload, timeout=POLL_TIMEOUT)
+                        break
+                    except queue.Full:
+                        continue
+    except Exception as e:
+        print(f"Listener stopped: {e}")
+    finally:
+        stop_event.set()
+        if conn:
+            conn.close()
+
+def next_batch(work_queue, batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW):
+    """Wait for one id, then collect more until the batch is full or the window ends"""
+    try:
+        batch = [work_queue.get(timeout=POLL_TIMEOUT)]
+    except queue.Empty:
+        return []
+
+    deadline = time.monotonic() + batch_window
+    while len(batch) < batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(work_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+
+    return batch
+
+def process_batch(conn, ids, aggregates, corpus):
+    """Update aggregates, vocabulary and corpus statistics for a batch of analysis ids"""
+    with conn.cursor() as cur:
+        cur.execute(BATCH_QUERY, (ids,))
+        records = cur.fetchall()
+    conn.rollback()  # end the read-only transaction
+
+    improvements = []
+    for record in records:
+        for sub in record["substitutions"] or []:
+            if "original" in sub and "suggestion" in sub:
+                improvements.append({
+                    "original": sub["original"],
+                    "suggestion": sub["suggestion"],
+                    "raison": sub.get("raison", "")
+                })
+
+    new_entries = 0
+    if improvements:
+        from analyze_vocab import enrich_vocabulary_database
+        new_entries = enrich_vocabulary_database(None, improvements)
+
+    transcripts = [r for r in records if r["transcript"]]
+    if transcripts:
+        from analyze_vocab import corpus_terms, get_nlp
+        docs = get_nlp().pipe(r["transcript"] for r in transcripts)
+        for doc, record in zip(docs, transcripts):
+            # Keyed by analysis id, so a retried batch is not counted twice
+            corpus.add_document(corpus_terms(doc), record["user_id"], doc_id=record["id"])
+
+    # Aggregates (and their watermark) only move once the batch has succeeded
+    aggregates.update(records)
+    return len(records), new_entries
+
+def missed_analyses(conn, aggregates, margin=CATCH_UP_MARGIN):
+    """Ids of analyses not yet processed, from margin before the saved watermark"""
+    watermark = aggregates.watermark
+    if watermark is None:
+        return []
+
+    since = pd.Timestamp(watermark) - margin
+    with conn.cursor() as cur:
+        cur.execute(CATCH_UP_QUERY, (since.to_pydatetime(),))
+        records = cur.fetchall()
+    conn.rollback()
+
+    processed = aggregates.processed_since(since)
+    return [record["id"] for record in records if record["id"] not in processed]
+
+def run(dsn=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW):
+    """Consume notifications until interrupted"""
+    from analyze_vocab import ensure_dirs as ensure_vocabulary_dirs
+
+    ensure_dirs()
+    ensure_vocabulary_dirs()
+    conn = get_db_connection(dsn)
+    if not conn:
+        return
+
+    aggregates = UserAggregates()
+    corpus = CorpusStats()
+    work_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    ready_event = threading.Event()
+
+    # Wait until LISTEN is active before catching up, so no insert falls in between
+    listener = threading.Thread(target=listen, args=(dsn, work_queue, stop_event, ready_event), daemon=True)
+    listener.start()
+    while not ready_event.wait(POLL_TIMEOUT):
+        if stop_event.is_set():
+            print("Listener could not start.")
+            aggregates.close()
+            corpus.close()
+            conn.close()
+            return
+    missed = missed_analyses(conn, aggregates)
+    print(f"Catching up on {len(missed)} analyses missed since last run.")
+
+    # (batch, failed attempts) still to process: catch-up first, then retries
+    pending = [(missed[i:i + batch_size], 0) for i in range(0, len(missed), batch_size)]
+    recent = OrderedDict((analysis_id, True) for analysis_id in missed)
+    try:
+        while pending or not (stop_event.is_set() and work_queue.empty()):
+            if pending:
+                batch, attempts = pending.pop(0)
+            else:
+                batch, attempts = [], 0
+                for analysis_id in next_batch(work_queue, batch_size, batch_window):
+                    if analysis_id not in recent:
+                        recent[analysis_id] = True
+                        batch.append(analysis_id)
+                while len(recent) > RECENT_IDS:
+                    recent.popitem(last=False)
+
+            if not batch:
+                continue
+
+            try:
+                processed, new_entries = process_batch(conn, batch, aggregates, corpus)
+                print(f"Processed {processed} analyses "
+                      f"({new_entries} new vocabulary entries, {work_queue.qsize()} queued).")
+            except Exception as e:
+                # Losing the database is not the batch's fault: retry without counting
+                if not isinstance(e, psycopg2.OperationalError):
+                    attempts += 1
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    # The connection was lost: reconnect before the retry
+                    conn = get_db_connection(dsn) or conn
+
+                if attempts < MAX_ATTEMPTS:
+                    print(f"Error processing {len(batch)} analyses, retrying in {RETRY_DELAY:.0f}s: {e}")
+                    pending.insert(0, (batch, attempts))
+                    time.sleep(RETRY_DELAY)
+                elif len(batch) > 1:
+                    # Bisect to isolate the failing analyses; each half gets one try
+                    print(f"Error processing {len(batch)} analyses, splitting the batch: {e}")
+                    middle = len(batch) // 2
+                    pending[:0] = [(batch[:middle], MAX_ATTEMPTS - 1), (batch[middle:], MAX_ATTEMPTS - 1)]
+                else:
+                    print(f"Giving up on analysis {batch[0]} after {attempts} attempts: {e}")
+                    aggregates.dead_letter(batch, e)
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        stop_event.set()
+        aggregates.close()
+        corpus.close()
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental analysis of new recordings")
+    parser.add_argument("command", choices=["install-trigger", "run"])
+    parser.add_argument("--dsn", help="Postgres connection string (default: SUPABASE_DB_URL)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW)
+    args = parser.parse_args()
+
+    if args.command == "install-trigger":
+        if install_trigger(args.dsn):
+            print(f"Trigger installed, notifying on channel '{NOTIFY_CHANNEL}'.")
+    else:
+        run(args.dsn, args.queue_size, args.batch_size, args.batch_window)
+
+if __name__ == "__main__":
+    main()
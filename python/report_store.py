@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Columnar Report Store for Eloquence App
+
+This module stores progress report summaries and per-session metrics as
+Parquet datasets partitioned by report date, instead of one JSON file per
+user:
+
+    output/reports/summaries/report_date=YYYY-MM-DD/part-*.parquet
+    output/reports/sessions/report_date=YYYY-MM-DD/part-*.parquet
+
+Each append writes a new file. Compaction merges a partition into a single
+file, keeping only the latest report of each user for that date. Readers
+can select columns, users and date ranges without opening other files.
+"""
+
+import json
+import sys
+import uuid
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pathlib import Path
+
+# Configuration
+REPORTS_DIR = Path("output/reports")
+
+PARTITIONING = ds.partitioning(pa.schema([("report_date", pa.string())]), flavor="hive")
+
+SUMMARY_SCHEMA = pa.schema([
+    ("user_id", pa.string()),
+    ("generated_at", pa.timestamp("us", tz="UTC")),
+    ("total_sessions", pa.int64()),
+    ("total_duration", pa.float64()),
+    ("avg_score", pa.float64()),
+    ("improvement_rate", pa.float64()),
+    ("vocabulary_improvement", pa.int64()),
+    ("vocabulary_level", pa.string()),
+    ("frequent_words", pa.string()),
+    ("report_date", pa.string())
+])
+
+SESSION_SCHEMA = pa.schema([
+    ("user_id", pa.string()),
+    ("generated_at", pa.timestamp("us", tz="UTC")),
+    ("id", pa.string()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("duree", pa.float64()),
+    ("score_eloquence", pa.float64()),
+    ("score_fluidite", pa.float64()),
+    ("score_vocabulaire", pa.float64()),
+    ("score_grammaire", pa.float64()),
+    ("score_rythme", pa.float64()),
+    ("report_date", pa.string())
+])
+
+DATASETS = {
+    "summaries": SUMMARY_SCHEMA,
+    "sessions": SESSION_SCHEMA
+}
+
+def dataset_dir(kind):
+    """Directory of a report dataset"""
+    if kind not in DATASETS:
+        raise ValueError(f"Unknown report dataset: {kind} (expected one of {', '.join(DATASETS)})")
+    return REPORTS_DIR / kind
+
+def summary_row(user_id, summary):
+    """Flatten a report summary into one row of the summaries dataset"""
+    vocabulary = summary.get("vocabulary") or {}
+
+    return {
+        "user_id": str(user_id),
+        "total_sessions": summary.get("total_sessions"),
+        "total_duration": summary.get("total_duration"),
+        "avg_score": summary.get("avg_score"),
+        "improvement_rate": summary.get("improvement_rate"),
+        "vocabulary_improvement": vocabulary.get("improvement"),
+        "vocabulary_level": vocabulary.get("vocabulary_level"),
+        "frequent_words": json.dumps(vocabulary.get("frequent_words", []), ensure_ascii=False)
+    }
+
+def to_table(df, schema):
+    """Convert a DataFrame to an Arrow table with the dataset schema"""
+    df = df.reindex(columns=schema.names)
+    for field in schema:
+        if pa.types.is_floating(field.type):
+            # Postgres NUMERIC columns come back as Decimal objects
+            df[field.name] = pd.to_numeric(df[field.name], errors="coerce").astype(float)
+        elif pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(df[field.name], utc=True)
+        elif pa.types.is_string(field.type):
+            df[field.name] = df[field.name].map(lambda v: None if pd.isna(v) else str(v))
+
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def write_partition(kind, df):
+    """Append rows to a dataset as a new file in each report_date partition"""
+    ds.write_dataset(
+        to_table(df, DATASETS[kind]),
+        dataset_dir(kind),
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+
+def append_report(user_id, summary, progress_data, report_date=None):
+    """Append a user's report summary and session metrics to the store"""
+    generated_at = pd.Timestamp.now(tz="UTC")
+    report_date = report_date or generated_at.strftime("%Y-%m-%d")
+
+    summary_df = pd.DataFrame([summary_row(user_id, summary)])
+    sessions_df = progress_data.copy()
+    sessions_df["user_id"] = str(user_id)
+
+    for df in (summary_df, sessions_df):
+        df["generated_at"] = generated_at
+        df["report_date"] = report_date
+
+    write_partition("summaries", summary_df)
+    write_partition("sessions", sessions_df)
+
+    return REPORTS_DIR
+
+def compact_partition(kind, report_date):
+    """Merge a partition into one file, keeping each user's latest report"""
+    partition = dataset_dir(kind) / f"report_date={report_date}"
+    files = sorted(f for f in partition.glob("*.parquet") if not f.name.startswith("_"))
+    if len(files) < 2:
+        return 0
+
+    schema = DATASETS[kind].remove(DATASETS[kind].get_field_index("report_date"))
+    df = ds.dataset([str(f) for f in files], schema=schema, format="parquet").to_table().to_pandas()
+
+    # Later reports of the same user on the same day replace earlier ones
+    latest = df.groupby("user_id")["generated_at"].transform("max")
+    df = df[df["generated_at"] == latest]
+    if kind == "sessions":
+        df = df.drop_duplicates(subset=["user_id", "id"], keep="last")
+
+    # Write the merged file first so readers never see an empty partition
+    # (files starting with "_" are ignored by dataset readers until renamed)
+    compacted = partition / f"part-{uuid.uuid4().hex}-compacted.parquet"
+    tmp = partition / f"_{compacted.name}"
+    pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), tmp)
+    tmp.rename(compacted)
+
+    for file in files:
+        file.unlink()
+
+    return len(files)
+
+def compact(report_date=None):
+    """Compact one report date, or every partition of both datasets"""
+    merged = 0
+    for kind in DATASETS:
+        if report_date:
+            dates = [report_date]
+        else:
+            dates = [p.name.split("=", 1)[1] for p in dataset_dir(kind).glob("report_date=*")]
+
+        for date in sorted(dates):
+            merged += compact_partition(kind, date)
+
+    return merged
+
+def read_reports(kind="summaries", columns=None, user_ids=None, start_date=None, end_date=None):
+    """Read a report dataset, scanning only the requested columns, users and dates"""
+    directory = dataset_dir(kind)
+    if not directory.exists():
+        return pd.DataFrame(columns=columns or DATASETS[kind].names)
+
+    dataset = ds.dataset(directory, schema=DATASETS[kind], format="parquet", partitioning=PARTITIONING)
+
+    conditions = []
+    if user_ids is not None:
+        conditions.append(ds.field("user_id").isin([str(u) for u in user_ids]))
+    if start_date:
+        conditions.append(ds.field("report_date") >= start_date)
+    if end_date:
+        conditions.append(ds.field("report_date") <= end_date)
+
+    row_filter = None
+    for condition in conditions:
+        row_filter = condition if row_filter is None else row_filter & condition
+
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the columnar report store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = subparsers.add_parser("compact", help="Merge small files of each partition")
+    compact_parser.add_argument("--date", help="Only compact this report date (YYYY-MM-DD)")
+
+    show_parser = subparsers.add_parser("show", help="Print stored report summaries")
+    show_parser.add_argument("user_ids", nargs="*", help="Only show these users")
+    show_parser.add_argument("--since", help="First report date (YYYY-MM-DD)")
+
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        merged = compact(args.date)
+        print(f"Compacted {merged} files.")
+    elif args.command == "show":
+        df = read_reports("summaries", user_ids=args.user_ids or None, start_date=args.since)
+        df.to_csv(sys.stdout, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ for advanced analysis and reporting on user progress.
 
 import os
 import json
+import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -17,6 +18,8 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
+from storage import BACKENDS, DEFAULT_BACKEND, get_backend
+
 # Load environment variables
 load_dotenv()
 
@@ -29,11 +32,11 @@ def ensure_dirs():
     OUTPUT_DIR.mkdir(exist_ok=True)
     FIGURES_DIR.mkdir(exist_ok=True)
 
-def get_db_connection():
-    """Get a connection to the database"""
+def get_db_connection(dsn=None):
+    """Get a connection to the database (SUPABASE_DB_URL unless a DSN is given)"""
     try:
         conn = psycopg2.connect(
-            os.getenv("SUPABASE_DB_URL"),
+            dsn or os.getenv("SUPABASE_DB_URL"),
             cursor_factory=RealDictCursor
         )
         return conn
@@ -41,135 +44,178 @@ def get_db_connection():
         print(f"Error connecting to database: {e}")
         return None
 
-def get_user_progress(user_id):
+def get_user_progress(user_id, backend=None):
     """Get progress data for a specific user"""
-    conn = get_db_connection()
-    if not conn:
+    db = get_backend(backend)
+    if not db:
         return None
     
     try:
-        with conn.cursor() as cur:
-            # Query to get user's recordings with scores
-            cur.execute("""
-                SELECT 
-                    e.id, 
-                    e.created_at, 
-                    e.duree, 
-                    e.score_eloquence,
-                    ae.score_fluidite, 
-                    ae.score_vocabulaire, 
-                    ae.score_grammaire, 
-                    ae.score_rythme
-                FROM 
-                    enregistrements e
-                LEFT JOIN 
-                    analyses_eloquence ae ON e.id = ae.enregistrement_id
-                WHERE 
-                    e.user_id = %s
-                ORDER BY 
-                    e.created_at
-            """, (user_id,))
-            
-            records = cur.fetchall()
-            
-            if not records:
-                return None
-                
-            # Convert to DataFrame for easier analysis
-            df = pd.DataFrame(records)
-            return df
+        # Query to get user's recordings with scores
+        records = db.query("""
+            SELECT 
+                e.id, 
+                e.created_at, 
+                e.duree, 
+                e.score_eloquence,
+                ae.score_fluidite, 
+                ae.score_vocabulaire, 
+                ae.score_grammaire, 
+                ae.score_rythme
+            FROM 
+                enregistrements e
+            LEFT JOIN 
+                analyses_eloquence ae ON e.id = ae.enregistrement_id
+            WHERE 
+                e.user_id = %s
+            ORDER BY 
+                e.created_at
+        """, (user_id,))
+        
+        if not records:
+            return None
             
+        # Convert to DataFrame for easier analysis
+        df = pd.DataFrame(records)
+        df["created_at"] = pd.to_datetime(df["created_at"], utc=True, format="ISO8601")  # text in SQLite
+        return df
+        
     except Exception as e:
         print(f"Error retrieving user progress: {e}")
         return None
     finally:
-        conn.close()
+        db.close()
 
-def analyze_vocabulary_progress(user_id):
-    """Analyze vocabulary improvement over time"""
-    conn = get_db_connection()
-    if not conn:
+def get_all_sessions(backend=None):
+    """Get scored sessions for every user, ordered by user and date"""
+    db = get_backend(backend)
+    if not db:
         return None
     
     try:
-        with conn.cursor() as cur:
-            # Query to get substitutions across sessions
-            cur.execute("""
-                SELECT 
-                    e.created_at, 
-                    ae.substitutions
-                FROM 
-                    analyses_eloquence ae
-                JOIN 
-                    enregistrements e ON ae.enregistrement_id = e.id
-                WHERE 
-                    e.user_id = %s AND 
-                    ae.substitutions IS NOT NULL
-                ORDER BY 
-                    e.created_at
-            """, (user_id,))
+        records = db.query("""
+            SELECT 
+                e.user_id, 
+                e.id, 
+                e.created_at, 
+                e.duree, 
+                e.score_eloquence,
+                ae.score_fluidite, 
+                ae.score_vocabulaire, 
+                ae.score_grammaire, 
+                ae.score_rythme
+            FROM 
+                enregistrements e
+            LEFT JOIN 
+                analyses_eloquence ae ON e.id = ae.enregistrement_id
+            ORDER BY 
+                e.user_id, 
+                e.created_at
+        """)
+        
+        if not records:
+            return None
             
-            records = cur.fetchall()
+        df = pd.DataFrame(records)
+        df["created_at"] = pd.to_datetime(df["created_at"], utc=True, format="ISO8601")  # text in SQLite
+        return df
+        
+    except Exception as e:
+        print(f"Error retrieving sessions: {e}")
+        return None
+    finally:
+        db.close()
+
+def analyze_vocabulary_progress(user_id, backend=None):
+    """Analyze vocabulary improvement over time"""
+    db = get_backend(backend)
+    if not db:
+        return None
+    
+    try:
+        # Query to get substitutions across sessions
+        records = db.query("""
+            SELECT 
+                e.created_at, 
+                ae.substitutions
+            FROM 
+                analyses_eloquence ae
+            JOIN 
+                enregistrements e ON ae.enregistrement_id = e.id
+            WHERE 
+                e.user_id = %s AND 
+                ae.substitutions IS NOT NULL
+            ORDER BY 
+                e.created_at
+        """, (user_id,))
+        
+        if not records:
+            return {
+                "improvement": 0,
+                "frequent_words": [],
+                "vocabulary_level": "débutant"
+            }
             
-            if not records:
-                return {
-                    "improvement": 0,
-                    "frequent_words": [],
-                    "vocabulary_level": "débutant"
-                }
-                
-            # Process substitutions data
-            all_words = []
-            improvement_count = 0
-            session_words = {}
+        # Process substitutions data
+        all_words = []
+        improvement_count = 0
+        session_words = {}
+        
+        for record in records:
+            # Local backends return timestamps and JSON as text
+            session_date = pd.Timestamp(record["created_at"]).strftime("%Y-%m-%d")
+            substitutions = record["substitutions"]
+            if isinstance(substitutions, str):
+                substitutions = json.loads(substitutions)
             
-            for record in records:
-                session_date = record["created_at"].strftime("%Y-%m-%d")
-                substitutions = record["substitutions"]
-                
-                if not substitutions:
-                    continue
-                    
-                words_in_session = []
-                for sub in substitutions:
-                    if "original" in sub and "suggestion" in sub:
-                        all_words.append(sub["original"])
-                        words_in_session.append(sub["original"])
-                        improvement_count += 1
+            if not substitutions:
+                continue
                 
-                session_words[session_date] = words_in_session
-            
-            # Find most frequent words
-            from collections import Counter
-            word_count = Counter(all_words)
-            most_frequent = word_count.most_common(5)
-            
-            # Determine vocabulary level based on number of improvements
-            vocab_level = "débutant"
-            if improvement_count > 20:
-                vocab_level = "intermédiaire"
-            if improvement_count > 50:
-                vocab_level = "avancé"
-            
-            return {
-                "improvement": improvement_count,
-                "frequent_words": most_frequent,
-                "vocabulary_level": vocab_level,
-                "session_words": session_words
-            }
+            words_in_session = []
+            for sub in substitutions:
+                if "original" in sub and "suggestion" in sub:
+                    all_words.append(sub["original"])
+                    words_in_session.append(sub["original"])
+                    improvement_count += 1
             
+            session_words[session_date] = words_in_session
+        
+        # Find most frequent words
+        from collections import Counter
+        word_count = Counter(all_words)
+        most_frequent = word_count.most_common(5)
+        
+        # Determine vocabulary level based on number of improvements
+        vocab_level = "débutant"
+        if improvement_count > 20:
+            vocab_level = "intermédiaire"
+        if improvement_count > 50:
+            vocab_level = "avancé"
+        
+        return {
+            "improvement": improvement_count,
+            "frequent_words": most_frequent,
+            "vocabulary_level": vocab_level,
+            "session_words": session_words
+        }
+        
     except Exception as e:
         print(f"Error analyzing vocabulary progress: {e}")
         return None
     finally:
-        conn.close()
+        db.close()
 
-def generate_progress_report(user_id):
-    """Generate a comprehensive progress report for a user"""
+def generate_progress_report(user_id, output_format="json", backend=None):
+    """Generate a comprehensive progress report for a user
+
+    With output_format="parquet" the report is appended to the columnar
+    report store (see report_store.py) instead of a per-user JSON file.
+    backend selects where the data is read from (see storage.py).
+    """
     ensure_dirs()
     
     # Get user progress data
-    progress_data = get_user_progress(user_id)
+    progress_data = get_user_progress(user_id, backend)
     if progress_data is None:
         return {
             "success": False,
@@ -177,7 +223,7 @@ def generate_progress_report(user_id):
         }
     
     # Get vocabulary progress
-    vocab_progress = analyze_vocabulary_progress(user_id)
+    vocab_progress = analyze_vocabulary_progress(user_id, backend)
     
     # Generate summary statistics
     summary = {
@@ -192,10 +238,14 @@ def generate_progress_report(user_id):
     if len(progress_data) > 1:
         generate_progress_figures(progress_data, user_id)
     
-    # Save report to JSON
-    report_file = OUTPUT_DIR / f"user_{user_id}_report.json"
-    with open(report_file, 'w', encoding='utf-8') as f:
-        json.dump(summary, f, ensure_ascii=False, indent=2)
+    if output_format == "parquet":
+        from report_store import append_report
+        report_file = append_report(user_id, summary, progress_data)
+    else:
+        # Save report to JSON
+        report_file = OUTPUT_DIR / f"user_{user_id}_report.json"
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
     
     return {
         "success": True,
@@ -216,6 +266,10 @@ def calculate_improvement_rate(progress_data):
     first_score = scores.iloc[0]
     last_score = scores.iloc[-1]
     
+    # A zero baseline has no meaningful percent change
+    if first_score == 0:
+        return 0
+    
     # Calculate percent improvement
     improvement = ((last_score - first_score) / first_score) * 100
     return round(improvement, 2)
@@ -277,23 +331,27 @@ def generate_progress_figures(progress_data, user_id):
         plt.close()
 
 def main():
-    if len(os.sys.argv) < 2:
-        print("Usage: python sql_integration.py <user_id>")
-        return
-    
-    user_id = os.sys.argv[1]
-    result = generate_progress_report(user_id)
+    parser = argparse.ArgumentParser(description="Generate progress reports")
+    parser.add_argument("user_ids", nargs="+", help="Users to report on")
+    parser.add_argument("--format", choices=["json", "parquet"], default="json",
+                        help="Per-user JSON files or the partitioned Parquet store (default: %(default)s)")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help="Database to read from (default: %(default)s)")
+    args = parser.parse_args()
     
-    if result["success"]:
-        print(f"Progress report generated successfully: {result['report_path']}")
-        print("\nSummary:")
-        print(f"- Total sessions: {result['summary']['total_sessions']}")
-        print(f"- Total duration: {result['summary']['total_duration']} seconds")
-        print(f"- Average score: {result['summary']['avg_score']:.2f}")
-        print(f"- Improvement rate: {result['summary']['improvement_rate']}%")
-        print(f"- Vocabulary level: {result['summary']['vocabulary']['vocabulary_level']}")
-    else:
-        print(f"Error generating report: {result['error']}")
+    for user_id in args.user_ids:
+        result = generate_progress_report(user_id, output_format=args.format, backend=args.backend)
+        
+        if result["success"]:
+            print(f"Progress report generated successfully: {result['report_path']}")
+            print("\nSummary:")
+            print(f"- Total sessions: {result['summary']['total_sessions']}")
+            print(f"- Total duration: {result['summary']['total_duration']} seconds")
+            print(f"- Average score: {result['summary']['avg_score']:.2f}")
+            print(f"- Improvement rate: {result['summary']['improvement_rate']}%")
+            print(f"- Vocabulary level: {result['summary']['vocabulary']['vocabulary_level']}")
+        else:
+            print(f"Error generating report for {user_id}: {result['error']}")
 
 if __name__ == "__main__":
     main()
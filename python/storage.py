@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Storage Backends for Eloquence App
+
+This module lets the analysis scripts run their SQL either against the
+Supabase Postgres database or against a local embedded copy (DuckDB or
+SQLite), so heavy historical analysis does not compete with production
+traffic and can run offline.
+
+The backend is chosen with the ELOQUENCE_BACKEND environment variable
+("postgres", "duckdb" or "sqlite") or a --backend option. The local copy is
+created and refreshed from Postgres with:
+
+    python storage.py snapshot --backend duckdb   # full copy
+    python storage.py sync --backend duckdb       # new and recently changed rows
+
+A snapshot is written into staging tables that replace the local ones only
+once the copy is complete, so an interrupted snapshot keeps the old copy.
+Sync upserts rows created since the latest local created_at minus a lookback
+window, so rows updated after that window (e.g. late score_eloquence updates)
+need a new snapshot.
+"""
+
+import os
+import sqlite3
+import argparse
+import pandas as pd
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+DEFAULT_BACKEND = os.getenv("ELOQUENCE_BACKEND", "postgres")
+LOCAL_DB_PATHS = {
+    "duckdb": Path("output/eloquence.duckdb"),
+    "sqlite": Path("output/eloquence.sqlite")
+}
+CHUNK_SIZE = 10000
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f+00:00"
+SQLITE_TYPES = {"VARCHAR": "TEXT", "TIMESTAMPTZ": "TEXT", "DOUBLE": "REAL"}
+SYNC_LOOKBACK = pd.Timedelta(days=1)
+STAGING_SUFFIX = "_snapshot"  # full snapshots are written here, then swapped in
+
+# Columns copied from Postgres; jsonb and uuid columns are copied as text.
+# "schema" gives the local column types, so they never depend on the data
+# of the first chunk (e.g. a column that happens to be all NULL).
+TABLES = {
+    "enregistrements": {
+        "columns": """
+            id::text AS id,
+            user_id::text AS user_id,
+            created_at,
+            date,
+            duree,
+            score_eloquence,
+            chemin_audio,
+            transcript
+        """,
+        "schema": [
+            ("id", "VARCHAR"),
+            ("user_id", "VARCHAR"),
+            ("created_at", "TIMESTAMPTZ"),
+            ("date", "TIMESTAMPTZ"),
+            ("duree", "DOUBLE"),
+            ("score_eloquence", "DOUBLE"),
+            ("chemin_audio", "VARCHAR"),
+            ("transcript", "VARCHAR")
+        ]
+    },
+    "analyses_eloquence": {
+        "columns": """
+            id::text AS id,
+            enregistrement_id::text AS enregistrement_id,
+            created_at,
+            score_fluidite,
+            score_vocabulaire,
+            score_grammaire,
+            score_rythme,
+            substitutions::text AS substitutions,
+            feedback
+        """,
+        "schema": [
+            ("id", "VARCHAR"),
+            ("enregistrement_id", "VARCHAR"),
+            ("created_at", "TIMESTAMPTZ"),
+            ("score_fluidite", "DOUBLE"),
+            ("score_vocabulaire", "DOUBLE"),
+            ("score_grammaire", "DOUBLE"),
+            ("score_rythme", "DOUBLE"),
+            ("substitutions", "VARCHAR"),
+            ("feedback", "VARCHAR")
+        ]
+    }
+}
+
+def columns_of_type(table, sql_type):
+    """Names of the columns of a copied table with the given local type"""
+    return [name for name, column_type in TABLES[table]["schema"] if column_type == sql_type]
+
+class PostgresBackend:
+    """The Supabase Postgres database"""
+
+    name = "postgres"
+
+    def __init__(self, dsn=None):
+        from sql_integration import get_db_connection
+        self.conn = get_db_connection(dsn)
+        if not self.conn:
+            raise ConnectionError("Could not connect to Postgres")
+
+    def query(self, sql, params=()):
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            return [dict(row) for row in cur.fetchall()]
+
+    def close(self):
+        self.conn.close()
+
+class DuckDBBackend:
+    """A local DuckDB file (columnar, fastest for analytical scans)"""
+
+    name = "duckdb"
+
+    def __init__(self, path=None, read_only=True):
+        import duckdb
+        self.path = Path(path or os.getenv("ELOQUENCE_LOCAL_DB") or LOCAL_DB_PATHS[self.name])
+        self.conn = duckdb.connect(str(self.path), read_only=read_only)
+
+    def query(self, sql, params=()):
+        cur = self.conn.execute(sql.replace("%s", "?"), list(params))
+        columns = [d[0] for d in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def table_exists(self, table):
+        return bool(self.query(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = %s", (table,)
+        ))
+
+    def create_table(self, table, name=None):
+        """(Re)create an empty table with the schema of a copied table"""
+        columns = ", ".join(f"{column} {sql_type}" for column, sql_type in TABLES[table]["schema"])
+        self.conn.execute(f"CREATE OR REPLACE TABLE {name or table} ({columns}, PRIMARY KEY (id))")
+
+    def write(self, table, df, name=None):
+        """Upsert a chunk of a copied table into the table name (default: table)"""
+        name = name or table
+        columns = ", ".join(column for column, _ in TABLES[table]["schema"])
+        self.conn.register("chunk", df)
+        # A failed chunk leaves the table as it was before the write
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            if not self.table_exists(name):
+                self.create_table(table, name)
+            self.conn.execute(f"INSERT OR REPLACE INTO {name} ({columns}) SELECT {columns} FROM chunk")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.conn.unregister("chunk")
+
+    def replace_table(self, table, staging):
+        """Atomically replace a table with a fully written staging table"""
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self.conn.close()
+
+class SQLiteBackend:
+    """A local SQLite file (no extra dependency)"""
+
+    name = "sqlite"
+
+    def __init__(self, path=None, read_only=True):
+        self.path = Path(path or os.getenv("ELOQUENCE_LOCAL_DB") or LOCAL_DB_PATHS[self.name])
+        uri = f"file:{self.path}?mode=ro" if read_only else f"file:{self.path}"
+        self.conn = sqlite3.connect(uri, uri=True)
+        self.conn.row_factory = sqlite3.Row
+
+    def query(self, sql, params=()):
+        cur = self.conn.execute(sql.replace("%s", "?"), tuple(params))
+        return [dict(row) for row in cur.fetchall()]
+
+    def table_exists(self, table):
+        return bool(self.query(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (table,)
+        ))
+
+    def create_table(self, table, name=None):
+        """(Re)create an empty table with the schema of a copied table"""
+        # Unlike DuckDB, SQLite lets a non-integer primary key be NULL unless told otherwise
+        columns = ", ".join(
+            f"{column} {SQLITE_TYPES[sql_type]}" + (" NOT NULL" if column == "id" else "")
+            for column, sql_type in TABLES[table]["schema"]
+        )
+        self.conn.execute(f"DROP TABLE IF EXISTS {name or table}")
+        self.conn.execute(f"CREATE TABLE {name or table} ({columns}, PRIMARY KEY (id))")
+
+    def write(self, table, df, name=None):
+        """Upsert a chunk of a copied table into the table name (default: table)"""
+        name = name or table
+        columns = [column for column, _ in TABLES[table]["schema"]]
+
+        # SQLite has no timestamp type: store one fixed ISO format so values
+        # parse uniformly and sort correctly as text
+        df = df[columns].copy()
+        for column in columns_of_type(table, "TIMESTAMPTZ"):
+            df[column] = pd.to_datetime(df[column], utc=True).dt.strftime(SQLITE_TIMESTAMP_FORMAT)
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+        # A failed chunk leaves the table as it was before the write
+        self.conn.execute("BEGIN")
+        try:
+            if not self.table_exists(name):
+                self.create_table(table, name)
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {name} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                rows
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def replace_table(self, table, staging):
+        """Atomically replace a table with a fully written staging table"""
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def close(self):
+        self.conn.close()
+
+BACKENDS = {
+    "postgres": PostgresBackend,
+    "duckdb": DuckDBBackend,
+    "sqlite": SQLiteBackend
+}
+
+def get_backend(name=None, **kwargs):
+    """Open a storage backend, or return None if it is unavailable"""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+    try:
+        return BACKENDS[name](**kwargs)
+    except Exception as e:
+        print(f"Error opening {name} backend: {e}")
+        return None
+
+def copy_table(source, target, table, since=None):
+    """Stream a Postgres table into a local backend in chunks
+
+    Without since, the whole table is copied into a staging table that
+    replaces the local one only once the copy is complete, so an
+    interrupted snapshot leaves the previous copy in place.
+    """
+    sql = f"SELECT {TABLES[table]['columns']} FROM {table}"
+    params = ()
+    if since is not None:
+        sql += " WHERE created_at > %s"
+        params = (since,)
+
+    staging = f"{table}{STAGING_SUFFIX}" if since is None else None
+    if staging:
+        target.create_table(table, staging)
+
+    copied = 0
+    # Named cursors are server-side, so the table is never fully in memory
+    with source.conn.cursor(name=f"copy_{table}") as cur:
+        cur.itersize = CHUNK_SIZE
+        cur.execute(sql, params)
+
+        while True:
+            rows = cur.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+
+            df = pd.DataFrame([dict(row) for row in rows])
+            for column in columns_of_type(table, "DOUBLE"):
+                df[column] = pd.to_numeric(df[column], errors="coerce").astype(float)
+            for column in columns_of_type(table, "TIMESTAMPTZ"):
+                df[column] = pd.to_datetime(df[column], utc=True)
+
+            target.write(table, df, staging)
+            copied += len(df)
+
+    source.conn.rollback()
+    if staging:
+        target.replace_table(table, staging)
+    return copied
+
+def local_watermark(target, table):
+    """Latest created_at already copied, minus the sync lookback"""
+    if not target.table_exists(table):
+        return None
+
+    latest = target.query(f"SELECT MAX(created_at) AS latest FROM {table}")[0]["latest"]
+    if latest is None:
+        return None
+    return (pd.Timestamp(latest) - SYNC_LOOKBACK).to_pydatetime()
+
+def snapshot(backend, path=None, incremental=False):
+    """Copy enregistrements and analyses_eloquence from Postgres into a local backend"""
+    if backend == "postgres":
+        raise ValueError("Snapshots are copied into a local backend (duckdb or sqlite)")
+
+    Path(path or LOCAL_DB_PATHS[backend]).parent.mkdir(exist_ok=True)
+    source = PostgresBackend()
+    target = BACKENDS[backend](path=path, read_only=False)
+
+    try:
+        counts = {}
+        for table in TABLES:
+            since = local_watermark(target, table) if incremental else None
+            counts[table] = copy_table(source, target, table, since)
+        return counts
+    finally:
+        source.close()
+        target.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy Postgres data into a local analytics database")
+    parser.add_argument("command", choices=["snapshot", "sync"])
+    parser.add_argument("--backend", choices=list(LOCAL_DB_PATHS), default="duckdb")
+    parser.add_argument("--path", help="Local database file (default: output/eloquence.<backend>)")
+    args = parser.parse_args()
+
+    counts = snapshot(args.backend, args.path, incremental=args.command == "sync")
+    for table, count in counts.items():
+        print(f"- {table}: {count} rows copied")
+
+if __name__ == "__main__":
+    main()
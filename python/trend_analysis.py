@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Trend Analytics Module for Eloquence App
+
+This script computes score trends for all users and sessions at once:
+rolling means, exponentially weighted means, least-squares slopes per user
+and metric, and cohort percentiles.
+
+Every computation is a grouped pandas/NumPy operation over the whole session
+table, so there is no per-user Python loop.
+"""
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from sql_integration import OUTPUT_DIR, ensure_dirs, get_all_sessions
+from storage import BACKENDS, DEFAULT_BACKEND
+
+# Constants
+METRICS = [
+    "score_eloquence",
+    "score_fluidite",
+    "score_vocabulaire",
+    "score_grammaire",
+    "score_rythme"
+]
+
+ROLLING_WINDOW = 3
+EWM_SPAN = 5
+COHORT_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+def prepare_sessions(sessions):
+    """Sort sessions by user and date, and number them per user"""
+    df = sessions.sort_values(["user_id", "created_at"], kind="mergesort").reset_index(drop=True)
+
+    # Postgres NUMERIC columns come back as Decimal objects
+    metrics = [m for m in METRICS if m in df.columns]
+    df[metrics] = df[metrics].apply(pd.to_numeric, errors="coerce").astype(float)
+
+    df["session_index"] = df.groupby("user_id").cumcount()
+    return df
+
+def add_rolling_trends(df, window=ROLLING_WINDOW, span=EWM_SPAN):
+    """Add per-user rolling mean and EWMA columns for each metric"""
+    metrics = [m for m in METRICS if m in df.columns]
+    grouped = df.groupby("user_id")[metrics]
+
+    rolling = grouped.rolling(window, min_periods=1).mean().reset_index(level=0, drop=True)
+    ewm = grouped.ewm(span=span).mean().reset_index(level=0, drop=True)
+
+    df = df.copy()
+    for metric in metrics:
+        df[f"{metric}_rolling"] = rolling[metric]
+        df[f"{metric}_ewm"] = ewm[metric]
+
+    return df
+
+def compute_user_slopes(df):
+    """Least-squares slope (points per session) of each metric for each user
+
+    Missing scores are left out of the fit. Users with fewer than two scored
+    sessions for a metric get NaN.
+    """
+    metrics = [m for m in METRICS if m in df.columns]
+
+    y = df[metrics].to_numpy(dtype=float)
+    valid = ~np.isnan(y)
+    y = np.where(valid, y, 0.0)
+    x = df["session_index"].to_numpy(dtype=float)[:, None]
+    xv = np.where(valid, x, 0.0)
+
+    # Sufficient statistics of the regression, summed per user in one pass
+    parts = np.hstack([valid.astype(float), xv, y, xv * y, xv * xv])
+    sums = pd.DataFrame(parts).groupby(df["user_id"].to_numpy(), sort=True).sum()
+    n, sx, sy, sxy, sxx = np.split(sums.to_numpy(), 5, axis=1)
+
+    denom = n * sxx - sx ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = np.where(denom > 0, (n * sxy - sx * sy) / denom, np.nan)
+
+    return pd.DataFrame(slopes, index=sums.index, columns=[f"{m}_slope" for m in metrics])
+
+def summarize_users(df):
+    """Per-user session count, mean and latest score, slope and cohort rank"""
+    metrics = [m for m in METRICS if m in df.columns]
+    grouped = df.groupby("user_id")
+
+    summary = pd.concat([
+        grouped.size().rename("sessions"),
+        grouped[metrics].mean().add_suffix("_mean"),
+        grouped[metrics].last().add_suffix("_last"),
+        compute_user_slopes(df)
+    ], axis=1)
+    summary.index.name = "user_id"
+
+    # Percentile of each user within the cohort (0-100)
+    for metric in metrics:
+        summary[f"{metric}_percentile"] = summary[f"{metric}_mean"].rank(pct=True) * 100
+
+    return summary
+
+def cohort_percentiles(summary, quantiles=COHORT_QUANTILES):
+    """Quantiles of per-user means and slopes across the cohort"""
+    columns = [c for c in summary.columns if c.endswith("_mean") or c.endswith("_slope")]
+    result = summary[columns].quantile(quantiles)
+    result.index.name = "quantile"
+    return result
+
+def compute_trends(sessions, window=ROLLING_WINDOW, span=EWM_SPAN):
+    """Compute session-level trends, per-user summaries and cohort percentiles"""
+    df = add_rolling_trends(prepare_sessions(sessions), window, span)
+    summary = summarize_users(df)
+
+    return {
+        "sessions": df,
+        "users": summary,
+        "cohort": cohort_percentiles(summary)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute score trends for all users")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help="Database to read from (default: %(default)s)")
+    args = parser.parse_args()
+
+    ensure_dirs()
+
+    start = time.perf_counter()
+    sessions = get_all_sessions(args.backend)
+    if sessions is None:
+        print("No session data found.")
+        return
+    loaded = time.perf_counter()
+
+    trends = compute_trends(sessions)
+    computed = time.perf_counter()
+
+    trends["sessions"].to_csv(OUTPUT_DIR / "trends_sessions.csv", index=False)
+    trends["users"].to_csv(OUTPUT_DIR / "trends_users.csv")
+    trends["cohort"].to_csv(OUTPUT_DIR / "trends_cohort.csv")
+
+    print(f"Analyzed {len(sessions)} sessions for {len(trends['users'])} users "
+          f"(load {loaded - start:.2f}s, compute {computed - loaded:.2f}s)")
+    print(f"Results saved to {OUTPUT_DIR}/trends_*.csv")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Compact Vocabulary Store for Eloquence App
+
+This module keeps the vocabulary in a few flat NumPy arrays instead of a
+DataFrame of Python strings:
+
+- each distinct string is stored once, as UTF-8 bytes in one buffer per
+  text column (motOriginal, motAmeliore, raison) with an int64 offsets
+  array; rows hold int32 codes into it;
+- categorie and niveau are small integer codes into a list of interned
+  category names;
+- the distinct lowercased motOriginal keys are kept sorted, with the rows
+  of each key, which gives O(log n) lookups without building a dictionary
+  per process.
+
+All arrays can be placed in one shared memory block, so analysis worker
+processes map the same vocabulary instead of each loading its own copy:
+
+    python vocab_store.py serve --name eloquence_vocab
+    ELOQUENCE_VOCAB_SHM=eloquence_vocab python analyze_vocab.py transcript.txt
+
+The block is a snapshot: restart serve for lookups to see entries appended
+to the vocabulary files since it started.
+
+Only attached workers get the full memory saving. A process that builds its
+own copy still parses the CSV files first, so its peak memory is several
+times the size of the arrays (from_csv avoids the DataFrame of Python
+strings, which trims the peak but does not remove it).
+"""
+
+import sys
+import json
+import struct
+import argparse
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+# Configuration
+TEXT_COLUMNS = ["motOriginal", "motAmeliore", "raison"]
+CATEGORY_COLUMNS = ["categorie", "niveau"]
+DEFAULT_SHM_NAME = "eloquence_vocab"
+
+HEADER = struct.Struct("<Q")  # length of the JSON metadata
+ALIGNMENT = 8
+
+def encode_strings(values):
+    """Concatenate strings as UTF-8 bytes and return (buffer, offsets)"""
+    encoded = [str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def encode_column(values, sort=False):
+    """Store each distinct string once and return (codes, buffer, offsets)"""
+    codes, uniques = pd.factorize(values.fillna("").astype(str), sort=sort)
+    data, offsets = encode_strings(uniques)
+    return codes.astype(np.int32), data, offsets
+
+def encode_arrow_column(values, sort=False):
+    """encode_column for a pyarrow string column, without Python string objects"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    encoded = pc.fill_null(values, "").combine_chunks().dictionary_encode()
+    codes = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int32)
+    uniques = encoded.dictionary
+    if sort:
+        # UTF-8 byte order is code point order, as for Python strings
+        order = pc.array_sort_indices(uniques).to_numpy()
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        codes = rank[codes]
+        uniques = uniques.take(pa.array(order))
+
+    # A string array is an int32 offsets buffer into one UTF-8 data buffer
+    _, offsets_buffer, data_buffer = uniques.buffers()
+    offsets = np.frombuffer(offsets_buffer, dtype=np.int32)[uniques.offset:uniques.offset + len(uniques) + 1]
+    data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(0, dtype=np.uint8)
+    return codes, data[offsets[0]:offsets[-1]].copy(), (offsets - offsets[0]).astype(np.int64)
+
+def key_arrays(key_codes, key_count):
+    """Rows of each sorted key, as (key_rows, key_starts)"""
+    key_rows = np.argsort(key_codes, kind="stable").astype(np.int32)
+    key_starts = np.zeros(key_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(key_codes, minlength=key_count), out=key_starts[1:])
+    return key_rows, key_starts
+
+class CompactVocabulary:
+    """Array-backed vocabulary with case-insensitive lookup on motOriginal"""
+
+    def __init__(self, arrays, categories, shm=None):
+        self.arrays = arrays
+        self.categories = {
+            column: [sys.intern(name) for name in names]
+            for column, names in categories.items()
+        }
+        self.size = len(arrays["motOriginal_codes"])
+        self.key_count = len(arrays["key_starts"]) - 1
+        # Keep the shared memory block open for as long as the views are used
+        self._shm = shm
+
+    @classmethod
+    def from_frame(cls, df):
+        arrays = {}
+        categories = {}
+
+        for column in TEXT_COLUMNS:
+            (arrays[f"{column}_codes"], arrays[f"{column}_data"],
+             arrays[f"{column}_offsets"]) = encode_column(df[column])
+
+        for column in CATEGORY_COLUMNS:
+            values = pd.Categorical(df[column])
+            arrays[f"{column}_codes"] = values.codes.astype(np.int16)
+            categories[column] = [str(c) for c in values.categories]
+
+        # Sorted distinct lowercased keys. The rows of key i are
+        # key_rows[key_starts[i]:key_starts[i + 1]], in row order, so the
+        # first matching row wins as with the DataFrame lookup
+        key_codes, arrays["key_data"], arrays["key_offsets"] = encode_column(
+            df["motOriginal"].fillna("").astype(str).str.lower(), sort=True
+        )
+        arrays["key_rows"], arrays["key_starts"] = key_arrays(key_codes, len(arrays["key_offsets"]) - 1)
+
+        return cls(arrays, categories)
+
+    @classmethod
+    def from_csv(cls, paths):
+        """Build the arrays straight from vocabulary CSV files
+
+        The files are parsed by pyarrow into Arrow buffers and encoded from
+        there, so no DataFrame of Python strings is built on the way.
+        """
+        import pyarrow as pa
+        import pyarrow.csv as pv
+        import pyarrow.compute as pc
+
+        columns = TEXT_COLUMNS + CATEGORY_COLUMNS
+        convert_options = pv.ConvertOptions(
+            column_types={column: pa.string() for column in columns},
+            include_columns=columns,
+            include_missing_columns=True,
+            strings_can_be_null=True
+        )
+
+        tables = []
+        for path in paths:
+            try:
+                tables.append(pv.read_csv(path, convert_options=convert_options))
+            except Exception as e:
+                print(f"Error loading {path}: {e}")
+
+        if tables:
+            table = pa.concat_tables(tables)
+        else:
+            table = pa.table({column: pa.array([], type=pa.string()) for column in columns})
+
+        arrays = {}
+        categories = {}
+
+        for column in TEXT_COLUMNS:
+            (arrays[f"{column}_codes"], arrays[f"{column}_data"],
+             arrays[f"{column}_offsets"]) = encode_arrow_column(table[column])
+
+        for column in CATEGORY_COLUMNS:
+            encoded = table[column].combine_chunks().dictionary_encode()
+            arrays[f"{column}_codes"] = pc.fill_null(encoded.indices, -1).to_numpy().astype(np.int16)
+            categories[column] = encoded.dictionary.to_pylist()
+
+        key_codes, arrays["key_data"], arrays["key_offsets"] = encode_arrow_column(
+            pc.utf8_lower(table["motOriginal"]), sort=True
+        )
+        arrays["key_rows"], arrays["key_starts"] = key_arrays(key_codes, len(arrays["key_offsets"]) - 1)
+
+        return cls(arrays, categories)
+
+    def string(self, column, index):
+        """Decode one distinct string of a column"""
+        data = self.arrays[f"{column}_data"]
+        offsets = self.arrays[f"{column}_offsets"]
+        return bytes(data[offsets[index]:offsets[index + 1]]).decode("utf-8")
+
+    def text(self, column, row):
+        """Decode one text cell"""
+        return self.string(column, self.arrays[f"{column}_codes"][row])
+
+    def category(self, column, row):
+        """Interned category name of one row (None when missing)"""
+        code = self.arrays[f"{column}_codes"][row]
+        return self.categories[column][code] if code >= 0 else None
+
+    def row(self, row):
+        """One vocabulary entry as a dict"""
+        entry = {column: self.text(column, row) for column in TEXT_COLUMNS}
+        entry.update({column: self.category(column, row) for column in CATEGORY_COLUMNS})
+        return entry
+
+    def key_index(self, word):
+        """Position of word.lower() among the sorted keys, or None"""
+        target = word.lower()
+
+        # Binary search for the leftmost key >= target
+        low, high = 0, self.key_count
+        while low < high:
+            mid = (low + high) // 2
+            if self.string("key", mid) < target:
+                low = mid + 1
+            else:
+                high = mid
+
+        if low < self.key_count and self.string("key", low) == target:
+            return low
+        return None
+
+    def key_rows(self, word):
+        """Indices of all entries whose motOriginal matches word (case-insensitive)"""
+        index = self.key_index(word)
+        if index is None:
+            return []
+        starts = self.arrays["key_starts"]
+        return [int(row) for row in self.arrays["key_rows"][starts[index]:starts[index + 1]]]
+
+    def find(self, word):
+        """Index of the first entry whose motOriginal matches word, or None"""
+        rows = self.key_rows(word)
+        return rows[0] if rows else None
+
+    def contains(self, original, suggestion):
+        """Whether an entry maps exactly original to suggestion"""
+        return any(
+            self.text("motOriginal", row) == original and self.text("motAmeliore", row) == suggestion
+            for row in self.key_rows(original)
+        )
+
+    def lookup(self, word):
+        """First entry whose motOriginal matches word (case-insensitive), or None"""
+        row = self.find(word)
+        return None if row is None else self.row(row)
+
+    def to_frame(self):
+        """Rebuild the DataFrame representation"""
+        return pd.DataFrame([self.row(i) for i in range(self.size)], columns=TEXT_COLUMNS + CATEGORY_COLUMNS)
+
+    def __len__(self):
+        return self.size
+
+    def _layout(self):
+        """Metadata describing where each array lives in the shared block"""
+        arrays = {}
+        offset = 0
+        for name, array in self.arrays.items():
+            arrays[name] = {"dtype": array.dtype.str, "length": len(array), "offset": offset}
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        return {"categories": self.categories, "arrays": arrays}, offset
+
+    def share(self, name=DEFAULT_SHM_NAME):
+        """Copy the arrays into a new shared memory block and return it
+
+        The caller owns the block and must close() and unlink() it.
+        """
+        layout, data_size = self._layout()
+        meta = json.dumps(layout).encode("utf-8")
+        start = -(-(HEADER.size + len(meta)) // ALIGNMENT) * ALIGNMENT
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(start + data_size, 1))
+        HEADER.pack_into(shm.buf, 0, len(meta))
+        shm.buf[HEADER.size:HEADER.size + len(meta)] = meta
+
+        for array_name, info in layout["arrays"].items():
+            array = self.arrays[array_name]
+            view = np.ndarray(len(array), dtype=array.dtype, buffer=shm.buf, offset=start + info["offset"])
+            view[:] = array
+            del view  # release the export so the block can be closed
+
+        return shm
+
+    @classmethod
+    def attach(cls, name=DEFAULT_SHM_NAME):
+        """Map a vocabulary shared by another process, without copying it"""
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the block with the resource
+            # tracker, which would unlink it when this process exits
+            from multiprocessing import resource_tracker
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+
+        (meta_length,) = HEADER.unpack_from(shm.buf, 0)
+        layout = json.loads(bytes(shm.buf[HEADER.size:HEADER.size + meta_length]).decode("utf-8"))
+        start = -(-(HEADER.size + meta_length) // ALIGNMENT) * ALIGNMENT
+
+        arrays = {}
+        for array_name, info in layout["arrays"].items():
+            array = np.ndarray(info["length"], dtype=np.dtype(info["dtype"]),
+                               buffer=shm.buf, offset=start + info["offset"])
+            array.flags.writeable = False
+            arrays[array_name] = array
+
+        return cls(arrays, layout["categories"], shm=shm)
+
+def main():
+    parser = argparse.ArgumentParser(description="Share the compact vocabulary with analysis processes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Load the vocabulary into shared memory until interrupted")
+    serve_parser.add_argument("--name", default=DEFAULT_SHM_NAME, help="Shared memory block name")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import signal
+        from analyze_vocab import VOCABULARY_DIR
+
+        vocab = CompactVocabulary.from_csv(VOCABULARY_DIR.glob("*.csv"))
+        shm = vocab.share(args.name)
+        print(f"Shared {len(vocab)} entries ({shm.size} bytes) as '{args.name}'. "
+              f"Set ELOQUENCE_VOCAB_SHM={args.name} in analysis processes. Press Ctrl+C to stop.")
+
+        try:
+            signal.pause()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            shm.close()
+            shm.unlink()
+
+if __name__ == "__main__":
+    main()